@@ -10,6 +10,9 @@ from pybit.unified_trading import HTTP
 
 logger = logging.getLogger(__name__)
 
+# Колонки датафрейма фандинг рейтов, возвращаемого get_funding_rates
+FUNDING_COLUMNS = ["symbol", "fundingRate", "predictedRate", "nextFundingTime", "timestamp", "lastPrice"]
+
 class BybitClient:
     """Класс для работы с API Bybit"""
     
@@ -145,50 +148,48 @@ class BybitClient:
             if not self.symbols_info:
                 await self.get_all_perpetual_symbols()
             
-            symbols = list(self.symbols_info.keys())
-            all_funding_data = []
+            await self._rate_limit_check()
+            
+            # Один запрос возвращает тикеры всех линейных контрактов вместо запроса на каждый символ
+            tickers = self.session.get_tickers(category="linear")
+            
+            if tickers["retCode"] != 0:
+                logger.error(f"Ошибка при получении тикеров: {tickers.get('retMsg', 'Unknown error')}")
+                return pd.DataFrame()
+            
+            # Собираем данные по колонкам, чтобы построить датафрейм одной аллокацией
+            funding_data = {column: [] for column in FUNDING_COLUMNS}
             
-            # Обрабатываем символы батчами для избежания лимитов API
-            batch_size = 50
-            for i in range(0, len(symbols), batch_size):
-                batch_symbols = symbols[i:i + batch_size]
+            for ticker_data in tickers["result"]["list"]:
+                symbol = ticker_data["symbol"]
                 
-                for symbol in batch_symbols:
-                    try:
-                        await self._rate_limit_check()
-                        
-                        # Получаем тикер с информацией о фандинге
-                        ticker_info = self.session.get_tickers(
-                            category="linear",
-                            symbol=symbol
-                        )
-                        
-                        if ticker_info["retCode"] == 0 and ticker_info["result"]["list"]:
-                            ticker_data = ticker_info["result"]["list"][0]
-                            
-                            next_funding_time = int(ticker_data["nextFundingTime"])
-                            predicted_rate = float(ticker_data["fundingRate"]) if ticker_data["fundingRate"] else 0.0
-                            
-                            # Проверяем, что данные валидны
-                            if next_funding_time > 0 and predicted_rate != 0:
-                                all_funding_data.append({
-                                    "symbol": symbol,
-                                    "fundingRate": predicted_rate,  # Текущий рейт
-                                    "predictedRate": predicted_rate,  # Предсказанный рейт
-                                    "nextFundingTime": next_funding_time / 1000,  # в секундах
-                                    "timestamp": datetime.datetime.fromtimestamp(next_funding_time / 1000),
-                                    "lastPrice": float(ticker_data.get("lastPrice", 0))
-                                })
-                        
-                    except Exception as e:
-                        logger.warning(f"Ошибка при получении фандинг рейта для {symbol}: {e}")
-                        continue
+                # Оставляем только активные USDT бессрочные контракты из кэша
+                if symbol not in self.symbols_info:
+                    continue
                 
-                # Небольшая пауза между батчами
-                if i + batch_size < len(symbols):
-                    await asyncio.sleep(0.5)
-            
-            df = pd.DataFrame(all_funding_data)
+                try:
+                    next_funding_time = int(ticker_data["nextFundingTime"])
+                    predicted_rate = float(ticker_data["fundingRate"]) if ticker_data["fundingRate"] else 0.0
+                    
+                    # Проверяем, что данные валидны
+                    if next_funding_time > 0 and predicted_rate != 0:
+                        # Сначала разбираем все поля, чтобы ошибка не оставила колонки разной длины
+                        next_funding_sec = next_funding_time / 1000  # в секундах
+                        timestamp = datetime.datetime.fromtimestamp(next_funding_sec)
+                        last_price = float(ticker_data.get("lastPrice", 0))
+                        
+                        funding_data["symbol"].append(symbol)
+                        funding_data["fundingRate"].append(predicted_rate)  # Текущий рейт
+                        funding_data["predictedRate"].append(predicted_rate)  # Предсказанный рейт
+                        funding_data["nextFundingTime"].append(next_funding_sec)
+                        funding_data["timestamp"].append(timestamp)
+                        funding_data["lastPrice"].append(last_price)
+                    
+                except Exception as e:
+                    logger.warning(f"Ошибка при получении фандинг рейта для {symbol}: {e}")
+                    continue
+            
+            df = pd.DataFrame(funding_data, columns=FUNDING_COLUMNS)
             
             if not df.empty:
                 # Сортируем по времени следующей выплаты
@@ -8,10 +8,11 @@ from typing import Dict, List, Optional, Tuple
 import signal
 import sys
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
-from bybit_client import BybitClient
+from bybit_client import FUNDING_COLUMNS, BybitClient
 
 # Настройка логирования с правильной кодировкой
 logging.basicConfig(
@@ -37,6 +38,7 @@ MIN_FUNDING_RATE = float(os.getenv("MIN_FUNDING_RATE"))  # Минимальны
 SECONDS_BEFORE_FUNDING = int(os.getenv("SECONDS_BEFORE_FUNDING"))  # За сколько секунд до выплаты открывать позицию
 TOP_PAIRS_COUNT = int(os.getenv("TOP_PAIRS_COUNT"))  # Количество топ пар по модулю рейта
 SECONDS_AFTER_FUNDING_TO_CLOSE = int(os.getenv("SECONDS_AFTER_FUNDING_TO_CLOSE"))  # Через сколько секунд после фандинга закрывать
+STATE_WRITE_INTERVAL = 0.2  # Интервал объединения записей файлов состояния (секунды)
 
 # Печатаем скрытую информацию для отладки (API ключи скрыты)
 logger.info(f"API ключ Bybit: {BYBIT_API_KEY[:5]}... (скрыт)")
@@ -54,10 +56,18 @@ class TradingBot:
         
         self.balance = 0.0
         self.active_trades = {}
-        self.funding_schedule = {}
+        self.funding_schedule = pd.DataFrame()
+        self.top_pairs_df = pd.DataFrame()
+        self.filtered_pairs_count = 0
         self.should_run = True
         self.telegram_bot = None
         
+        # Отложенная запись файлов состояния: путь -> последний снимок данных
+        self._pending_writes = {}
+        self._dirty = asyncio.Event()
+        self._state_lock = asyncio.Lock()
+        self._writer_task = None
+        
         # Статистика
         self.total_trades = 0
         self.successful_trades = 0
@@ -70,7 +80,8 @@ class TradingBot:
         if TELEGRAM_BOT_TOKEN and TELEGRAM_USER_ID:
             try:
                 from aiogram import Bot
-                self.telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
+                from telegram_session import get_shared_session
+                self.telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN, session=get_shared_session())
                 await self.send_telegram_message("🚀 Фандинг арбитраж бот запущен!")
                 logger.info("Telegram уведомления инициализированы")
             except Exception as e:
@@ -99,21 +110,29 @@ class TradingBot:
         try:
             funding_df = await self.bybit.get_funding_rates()
             
+            # Контракт с клиентом: один датафрейм с колонками FUNDING_COLUMNS
+            if isinstance(funding_df, list):
+                funding_df = pd.DataFrame.from_records(funding_df, columns=FUNDING_COLUMNS)
+            
             if not funding_df.empty:
-                # Обновляем глобальное расписание
-                self.funding_schedule = {
-                    row["symbol"]: {
-                        "nextFundingTime": row["nextFundingTime"],
-                        "predictedRate": row["predictedRate"],
-                        "timestamp": row["timestamp"]
-                    } 
-                    for _, row in funding_df.iterrows()
-                }
+                missing_columns = set(FUNDING_COLUMNS).difference(funding_df.columns)
+                assert not missing_columns, f"В данных фандинга нет колонок: {missing_columns}"
+                
+                # Абсолютное значение рейта считаем один раз для всех потребителей
+                funding_df["abs_rate"] = funding_df["predictedRate"].abs()
+                
+                # Обновляем глобальное расписание (индекс по символу, без словаря на каждую строку)
+                self.funding_schedule = funding_df.set_index("symbol")[
+                    ["nextFundingTime", "predictedRate", "timestamp"]
+                ]
                 
                 logger.info(f"Обновлено расписание фандинг выплат для {len(funding_df)} пар")
                 
+                # Отбираем ТОП пар один раз за цикл: результат используют и файл, и торговля
+                self.top_pairs_df, self.filtered_pairs_count = self.select_top_pairs(funding_df)
+                
                 # Сохраняем данные в файл
-                await self.save_funding_rates(funding_df)
+                await self.save_funding_rates(funding_df, self.top_pairs_df, self.filtered_pairs_count)
                 
             return funding_df
         except Exception as e:
@@ -144,28 +163,30 @@ class TradingBot:
                 "timestamp": datetime.datetime.now().isoformat()
             }
             
-            # Сохраняем в файл
-            with open("bot_status.json", "w", encoding='utf-8') as f:
-                json.dump(status_data, f, indent=4, default=self.json_serial, ensure_ascii=False)
+            # Ставим в очередь на запись в файл
+            self._schedule_write("bot_status.json", status_data)
             
             logger.info("Сохранен статус торгового бота")
             
         except Exception as e:
             logger.error(f"Ошибка при сохранении статуса бота: {e}")
     
-    async def save_funding_rates(self, funding_df: pd.DataFrame):
+    async def save_funding_rates(
+        self,
+        funding_df: pd.DataFrame,
+        top_pairs_df: Optional[pd.DataFrame] = None,
+        filtered_count: Optional[int] = None
+    ):
         """Сохранение данных о фандинг рейтах в файл"""
         try:
             if funding_df.empty:
                 return
             
-            # Добавляем колонку с абсолютным значением фандинг рейта
-            funding_df["abs_rate"] = funding_df["predictedRate"].abs()
-            
-            # Фильтруем только те пары, у которых фандинг рейт больше минимального
-            filtered_df = funding_df[funding_df["abs_rate"] >= MIN_FUNDING_RATE]
+            # Отбираем ТОП пар по модулю, если отбор не передан из get_funding_rates
+            if top_pairs_df is None or filtered_count is None:
+                top_pairs_df, filtered_count = self.select_top_pairs(funding_df)
             
-            if filtered_df.empty:
+            if filtered_count == 0:
                 logger.info(f"Нет пар с фандинг рейтом >= {MIN_FUNDING_RATE}")
                 
                 # Создаем пустой файл с метаданными
@@ -178,79 +199,135 @@ class TradingBot:
                     "min_funding_rate_percent": MIN_FUNDING_RATE * 100
                 }
                 
-                with open("funding_rates.json", "w", encoding='utf-8') as f:
-                    json.dump(funding_data, f, indent=4, default=self.json_serial, ensure_ascii=False)
+                self._schedule_write("funding_rates.json", funding_data)
                 
                 return
             
             # Получаем текущее время для расчета времени до выплаты
             current_time = datetime.datetime.now().timestamp()
             
-            # Сортируем по абсолютному значению фандинг рейта (берем ТОП-20 по модулю)
-            top_pairs_df = filtered_df.nlargest(TOP_PAIRS_COUNT, 'abs_rate')
+            # Считаем все поля сразу по колонкам, без прохода по строкам
+            predicted_rate = top_pairs_df["predictedRate"].to_numpy(dtype=np.float64)
+            abs_rate = top_pairs_df["abs_rate"].to_numpy(dtype=np.float64)
+            next_funding_time = top_pairs_df["nextFundingTime"].to_numpy(dtype=np.float64)
+            time_until = next_funding_time - current_time
+            is_positive = predicted_rate > 0
+            
+            # Форматируем время до выплаты для вывода
+            hours, remainder = np.divmod(np.maximum(time_until, 0), 3600)
+            minutes, seconds = np.divmod(remainder, 60)
+            time_until_str = [
+                f"{h}ч {m}м {s}с" if until > 0 else "Прошло"
+                for h, m, s, until in zip(
+                    hours.astype(np.int64).tolist(),
+                    minutes.astype(np.int64).tolist(),
+                    seconds.astype(np.int64).tolist(),
+                    time_until.tolist()
+                )
+            ]
+            
+            top_rates_df = pd.DataFrame({
+                "symbol": top_pairs_df["symbol"].to_numpy(),
+                "rate": predicted_rate,
+                "rate_percent": predicted_rate * 100,  # В процентах
+                "abs_rate": abs_rate,
+                "abs_rate_percent": abs_rate * 100,  # Абсолютное значение в процентах
+                "time_until": time_until_str,
+                "time": top_pairs_df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy(),
+                "next_funding_time": next_funding_time,
+                "seconds_until": time_until,
+                # Направление фандинг рейта и позиция для получения выплаты
+                "direction": np.where(is_positive, "positive", "negative"),
+                "position_to_open": np.where(is_positive, "SHORT", "LONG"),
+                "expected_profit_usdt": abs_rate * TRADE_AMOUNT_USDT  # Ожидаемая прибыль в USDT
+            })
             
             # Список для сохранения данных о топ рейтах
-            top_rates = []
-            
-            # Проходим по всем топовым парам
-            for _, row in top_pairs_df.iterrows():
-                symbol = row["symbol"]
-                next_funding_time = row["nextFundingTime"]
-                predicted_rate = row["predictedRate"]
-                abs_rate = row["abs_rate"]
-                time_until = next_funding_time - current_time
-                
-                # Форматируем время до выплаты для вывода
-                if time_until > 0:
-                    hours, remainder = divmod(time_until, 3600)
-                    minutes, seconds = divmod(remainder, 60)
-                    time_until_str = f"{int(hours)}ч {int(minutes)}м {int(seconds)}с"
-                else:
-                    time_until_str = "Прошло"
-                
-                # Определяем направление фандинг рейта
-                direction = "positive" if predicted_rate > 0 else "negative"
-                
-                # Определяем, какую позицию нужно открыть для получения выплаты
-                position_to_open = "SHORT" if predicted_rate > 0 else "LONG"
-                
-                # Добавляем в список для сохранения
-                top_rates.append({
-                    "symbol": symbol,
-                    "rate": float(predicted_rate),
-                    "rate_percent": float(predicted_rate) * 100,  # В процентах
-                    "abs_rate": float(abs_rate),
-                    "abs_rate_percent": float(abs_rate) * 100,  # Абсолютное значение в процентах
-                    "time_until": time_until_str,
-                    "time": row["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
-                    "next_funding_time": next_funding_time,
-                    "seconds_until": time_until,
-                    "direction": direction,
-                    "position_to_open": position_to_open,
-                    "expected_profit_usdt": float(abs_rate) * TRADE_AMOUNT_USDT  # Ожидаемая прибыль в USDT
-                })
+            top_rates = top_rates_df.to_dict("records")
             
             # Сохраняем топ рейты в файл
             funding_data = {
                 "top_rates": top_rates,
                 "update_time": datetime.datetime.now().isoformat(),
                 "total_pairs": len(funding_df),
-                "filtered_pairs": len(filtered_df),
+                "filtered_pairs": filtered_count,
                 "top_pairs_count": len(top_rates),
                 "min_funding_rate": MIN_FUNDING_RATE,
                 "min_funding_rate_percent": MIN_FUNDING_RATE * 100,
                 "trade_amount_usdt": TRADE_AMOUNT_USDT,
-                "total_expected_profit": sum(rate["expected_profit_usdt"] for rate in top_rates)
+                "total_expected_profit": float(top_rates_df["expected_profit_usdt"].sum())
             }
             
-            with open("funding_rates.json", "w", encoding='utf-8') as f:
-                json.dump(funding_data, f, indent=4, default=self.json_serial, ensure_ascii=False)
+            self._schedule_write("funding_rates.json", funding_data)
             
             logger.info(f"Сохранено {len(top_rates)} топовых пар в funding_rates.json")
             
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных о фандинг рейтах: {e}")
     
+    def _schedule_write(self, path: str, data: dict):
+        """Постановка JSON файла в очередь на запись фоновой задачей"""
+        self._pending_writes[path] = data
+        self._dirty.set()
+    
+    async def _state_writer(self):
+        """Фоновая запись файлов состояния: пачка обновлений сбрасывается одной записью"""
+        while self.should_run:
+            await self._dirty.wait()
+            await asyncio.sleep(STATE_WRITE_INTERVAL)
+            await self.flush_state()
+    
+    async def flush_state(self):
+        """Запись всех накопленных файлов состояния на диск"""
+        self._dirty.clear()
+        
+        async with self._state_lock:
+            pending, self._pending_writes = self._pending_writes, {}
+            
+            for path, data in pending.items():
+                try:
+                    await asyncio.to_thread(self._write_json_file, path, data)
+                except Exception as e:
+                    logger.error(f"Ошибка при записи файла {path}: {e}")
+    
+    async def stop_state_writer(self):
+        """Остановка фоновой записи с сохранением оставшихся данных"""
+        if self._writer_task:
+            # Будим writer, чтобы он вышел из цикла после should_run = False
+            self._dirty.set()
+            await self._writer_task
+            self._writer_task = None
+        
+        await self.flush_state()
+    
+    def _write_json_file(self, path: str, data: dict):
+        """Атомарная запись JSON: через временный файл и os.replace"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(data, f, indent=4, default=self.json_serial, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def select_top_pairs(self, funding_df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """
+        Отбор ТОП пар по модулю фандинг рейта среди пар с рейтом не меньше минимального
+        
+        Returns:
+            Tuple[pd.DataFrame, int]: Строки ТОП пар и количество пар, прошедших фильтр
+        """
+        # Колонка с абсолютным значением фандинг рейта обычно уже посчитана в get_funding_rates
+        if "abs_rate" not in funding_df.columns:
+            funding_df["abs_rate"] = funding_df["predictedRate"].abs()
+        
+        # Фильтруем по индексам массива, не копируя весь отфильтрованный датафрейм
+        abs_rate = funding_df["abs_rate"].to_numpy()
+        idx = np.flatnonzero(abs_rate >= MIN_FUNDING_RATE)
+        
+        # Сортируем прошедшие фильтр по убыванию модуля и копируем только ТОП строки.
+        # Сортировка стабильная: при равных рейтах раньше идут пары с ближайшей выплатой
+        top_idx = idx[np.argsort(-abs_rate[idx], kind="stable")[:TOP_PAIRS_COUNT]]
+        
+        return funding_df.iloc[top_idx], len(idx)
+    
     @staticmethod
     def json_serial(obj):
         """Функция для сериализации объектов datetime в JSON"""
@@ -418,49 +495,43 @@ class TradingBot:
                 if not funding_df.empty:
                     current_time = datetime.datetime.now().timestamp()
                     
-                    # Добавляем колонку с абсолютным значением фандинг рейта
-                    funding_df["abs_rate"] = funding_df["predictedRate"].abs()
-                    
-                    # Фильтруем только те пары, у которых фандинг рейт больше минимального
-                    filtered_df = funding_df[funding_df["abs_rate"] >= MIN_FUNDING_RATE]
-                    
-                    if not filtered_df.empty:
-                        # Берем ТОП-20 пар по абсолютному значению фандинг рейта
-                        top_pairs_df = filtered_df.nlargest(TOP_PAIRS_COUNT, 'abs_rate')
+                    # ТОП пар по модулю фандинг рейта уже отобран в get_funding_rates
+                    if self.filtered_pairs_count > 0:
+                        # Проверяем время для открытия позиций сразу для всех пар и берем только попавшие в окно
+                        time_until_all = self.top_pairs_df["nextFundingTime"].to_numpy() - current_time
+                        in_window = (time_until_all > 0) & (time_until_all <= SECONDS_BEFORE_FUNDING)
                         
                         # Мониторим время для открытия позиций
-                        for _, row in top_pairs_df.iterrows():
+                        for _, row in self.top_pairs_df[in_window].iterrows():
                             symbol = row["symbol"]
                             next_funding_time = row["nextFundingTime"]
                             predicted_rate = row["predictedRate"]
                             abs_rate = row["abs_rate"]
                             time_until = next_funding_time - current_time
                             
-                            # Проверяем, подходит ли время для открытия позиции
-                            if 0 < time_until <= SECONDS_BEFORE_FUNDING:
-                                # Определяем сторону для позиции (противоположную для получения выплаты)
-                                side = "Sell" if predicted_rate > 0 else "Buy"
+                            # Определяем сторону для позиции (противоположную для получения выплаты)
+                            side = "Sell" if predicted_rate > 0 else "Buy"
+                            
+                            # Проверяем, что у нас нет открытой позиции по этому символу
+                            symbol_active = any(
+                                trade_data["symbol"] == symbol and not trade_data.get("closed", False)
+                                for trade_data in self.active_trades.values()
+                            )
                                 
-                                # Проверяем, что у нас нет открытой позиции по этому символу
-                                symbol_active = any(
-                                    trade_data["symbol"] == symbol and not trade_data.get("closed", False)
-                                    for trade_data in self.active_trades.values()
-                                )
-                                    
-                                if not symbol_active:
-                                    # Рассчитываем размер позиции
-                                    size = await self.bybit.calculate_position_size(symbol, TRADE_AMOUNT_USDT)
+                            if not symbol_active:
+                                # Рассчитываем размер позиции
+                                size = await self.bybit.calculate_position_size(symbol, TRADE_AMOUNT_USDT)
+                                
+                                if size > 0:
+                                    # Открываем позицию
+                                    order_id = await self.open_position(symbol, side, size, predicted_rate)
                                     
-                                    if size > 0:
-                                        # Открываем позицию
-                                        order_id = await self.open_position(symbol, side, size, predicted_rate)
-                                        
-                                        if order_id:
-                                            logger.info(
-                                                f"🎯 Открыта позиция перед фандингом: {symbol} {side} "
-                                                f"(фандинг через {time_until:.1f} сек, "
-                                                f"ожидаемый рейт: {predicted_rate:.6f})"
-                                            )
+                                    if order_id:
+                                        logger.info(
+                                            f"🎯 Открыта позиция перед фандингом: {symbol} {side} "
+                                            f"(фандинг через {time_until:.1f} сек, "
+                                            f"ожидаемый рейт: {predicted_rate:.6f})"
+                                        )
                         
                         # Проверяем, нужно ли закрыть позиции после фандинга
                         for order_id, trade_data in list(self.active_trades.items()):
@@ -469,11 +540,9 @@ class TradingBot:
                                 
                             symbol = trade_data["symbol"]
                             
-                            # Ищем символ в данных фандинга
-                            symbol_data = funding_df[funding_df["symbol"] == symbol]
-                            
-                            if not symbol_data.empty:
-                                next_funding_time = symbol_data.iloc[0]["nextFundingTime"]
+                            # Ищем символ в расписании фандинга
+                            if symbol in self.funding_schedule.index:
+                                next_funding_time = self.funding_schedule.at[symbol, "nextFundingTime"]
                                 time_until = next_funding_time - current_time
                                 
                                 # Если прошло достаточно времени после выплаты, закрываем позицию
@@ -530,6 +599,9 @@ class TradingBot:
             # Настраиваем обработчики сигналов
             self.setup_signal_handlers()
             
+            # Запускаем фоновую запись файлов состояния
+            self._writer_task = asyncio.create_task(self._state_writer())
+            
             # Инициализируем Telegram уведомления
             await self.init_telegram_notifications()
             
@@ -561,6 +633,14 @@ class TradingBot:
             logger.error(f"Ошибка при запуске бота: {e}")
             await self.send_telegram_message(f"❌ Ошибка при запуске бота: {e}")
             self.should_run = False
+            
+        finally:
+            # Сохраняем накопленные файлы состояния перед выходом
+            await self.stop_state_writer()
+            
+            if self.telegram_bot:
+                from telegram_session import close_shared_session
+                await close_shared_session()
 
 async def main():
     """Главная функция запуска бота"""
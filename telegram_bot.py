@@ -1,18 +1,41 @@
 import os
 import asyncio
 import logging
-import json
 import datetime
+import functools
+import heapq
+import queue
+import signal
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+import orjson
 from dotenv import load_dotenv
 
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживает Windows
+    uvloop = None
+
+try:
+    from watchfiles import awatch
+except ImportError:  # Без watchfiles файлы состояния опрашиваются по таймеру
+    awatch = None
+
 # Настройка логирования с правильной кодировкой
+# Запись в файл и консоль выполняется в фоновом потоке, event loop только кладет запись в очередь
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(
+    _log_queue,
+    logging.FileHandler("telegram_bot.log", encoding='utf-8'),
+    logging.StreamHandler(),
+    respect_handler_level=True
+)
+_log_listener.start()
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("telegram_bot.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -21,26 +44,214 @@ load_dotenv()
 
 # Импорты для бота
 from aiogram import Bot, Dispatcher, Router, F
+from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from telegram_session import close_shared_session, get_shared_session
 
 # Конфигурация
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_USER_ID = int(os.getenv("TELEGRAM_USER_ID", "0"))
 MIN_FUNDING_RATE = float(os.getenv("MIN_FUNDING_RATE", "0.0001"))
 
+# Webhook (если URL не задан, бот работает через long polling)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").rstrip("/")
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/wh")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+POLLING_TIMEOUT = 60  # Секунд ожидания в long polling запросе getUpdates
+MESSAGE_CACHE_SIZE = 2048  # Сколько последних сообщений помнить в кэшах по (chat_id, message_id)
+STATE_FILES = ("bot_status.json", "funding_rates.json")
+STATE_POLL_INTERVAL = 0.5  # Секунд между проверками файлов состояния, если нет watchfiles
+EDIT_DEBOUNCE = 0.3  # Секунд, в течение которых нажатия кнопок склеиваются в одно редактирование
+
+# Заголовки панелей для сообщений, о которых бот не помнит
+PANEL_TITLES = (
+    ("Статус бота", "status"),
+    ("Ближайшие фандинг выплаты", "funding"),
+    ("Топ фандинг рейты", "top"),
+    ("Статистика торговли", "stats"),
+    ("Настройки бота", "settings")
+)
+
+# Неизменяемые тексты сообщений
+MENU_TEXT = (
+    "🤖 <b>Фандинг Арбитраж Бот</b>\n\n"
+    "Добро пожаловать! Я помогу вам отслеживать и торговать на фандинг рейтах Bybit.\n\n"
+    "🎯 <b>Стратегия:</b> Ищу пары с наибольшими фандинг рейтами по модулю, "
+    "открываю позицию за 10 секунд до выплаты, чтобы получить фандинг, "
+    "затем закрываю после получения выплаты.\n\n"
+    "📊 Выберите действие:"
+)
+
+STARTUP_TEXT = (
+    "🤖 <b>Telegram бот запущен!</b>\n\n"
+    "✅ Бот готов к работе\n"
+    "📊 Используйте /start для начала работы\n"
+    "💹 Мониторинг фандинг рейтов активен"
+)
+
+SETTINGS_TEMPLATE = (
+    "⚙️ <b>Настройки бота</b>\n\n"
+    "💵 <b>Сумма сделки:</b> {trade_amount_usdt} USDT\n"
+    "📊 <b>Мин. фандинг рейт:</b> {min_funding_rate_percent:.4f}%\n"
+    "⏰ <b>Секунд до фандинга:</b> {seconds_before_funding}\n"
+    "🔝 <b>Топ пар для торговли:</b> {top_pairs_count}\n\n"
+    "📈 <b>Стратегия:</b>\n"
+    "• Ищем {strategy_pairs_count} пар с наибольшим фандинг рейтом по модулю\n"
+    "• Открываем позицию за {strategy_seconds} сек до выплаты\n"
+    "• Если рейт положительный → SHORT (получаем от лонгистов)\n"
+    "• Если рейт отрицательный → LONG (получаем от шортистов)\n"
+    "• Закрываем через 30 сек после получения фандинга\n\n"
+    "⚠️ <i>Настройки можно изменить только в .env файле</i>"
+)
+
+# Кэш разобранных JSON файлов: путь -> (версия файла, данные)
+_json_cache = {}
+
+def file_version(st):
+    """
+    Версия файла по результату stat
+    
+    Оба бота подменяют файлы через os.replace, поэтому inode меняется при каждой
+    записи, даже если две записи попали в один тик mtime.
+    """
+    return (st.st_ino, st.st_mtime_ns)
+
+def load_json_cached(path):
+    """Чтение JSON файла с кэшем: файл разбирается заново только после изменения"""
+    version = file_version(os.stat(path))
+    
+    cached = _json_cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    
+    _json_cache[path] = (version, data)
+    return data
+
+class LRUDict(OrderedDict):
+    """Словарь ограниченного размера: при переполнении вытесняется самая давняя запись"""
+    
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+@functools.lru_cache(maxsize=64)
+def _format_iso(ts):
+    """Перевод ISO времени в формат для сообщений, повторные вызовы берутся из кэша"""
+    try:
+        return datetime.datetime.fromisoformat(ts.replace('Z', '+00:00')).strftime("%d.%m.%Y %H:%M:%S")
+    except Exception:
+        return ts
+
 class TelegramBotServer:
     def __init__(self, token, user_id=None):
-        self.bot = Bot(token=token)
+        self.bot = Bot(
+            token=token,
+            session=get_shared_session(),
+            default=DefaultBotProperties(parse_mode="HTML")
+        )
         self.user_id = user_id
         self.storage = MemoryStorage()
         self.dp = Dispatcher(storage=self.storage)
         self.router = Router()
         self.dp.include_router(self.router)
         
+        # Последний показанный рендер по (chat_id, message_id)
+        self._last_render = LRUDict(MESSAGE_CACHE_SIZE)
+        
+        # Какая панель показана в сообщении: (chat_id, message_id) -> имя панели
+        self._panel_by_msg = LRUDict(MESSAGE_CACHE_SIZE)
+        self._panel_senders = {
+            "status": self.send_status,
+            "funding": self.send_funding,
+            "top": self.send_top,
+            "stats": self.send_stats,
+            "settings": self.send_settings
+        }
+        
+        # Последние разобранные файлы состояния, обновляются фоновой задачей
+        self._state = None
+        self._funding = None
+        self._watch_task = None
+        self._rendered_funding = None
+        self._rendered_top = None
+        
+        # Последняя записанная версия bot_status.json: (версия файла, данные)
+        self._status_cache = None
+        
+        # Отложенные редактирования: (chat_id, message_id) -> TimerHandle
+        self._pending_edits = {}
+        self._edit_tasks = set()
+        
+        # Обработчики callback-запросов по значению callback.data
+        self._cb_handlers = {
+            "status": self.handle_status,
+            "funding": self.handle_funding,
+            "top": self.handle_top,
+            "stats": self.handle_stats,
+            "settings": self.handle_settings,
+            "emergency_stop": self.handle_emergency_stop,
+            "refresh": self.handle_refresh,
+            "menu": self.handle_menu,
+            "confirm_stop": self.handle_confirm_stop,
+            "cancel_stop": self.handle_cancel_stop
+        }
+        
         # Регистрация базовых обработчиков
         self._setup_handlers()
+        
+        # Клавиатуры не меняются, поэтому создаются один раз
+        self._kb_menu = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="📊 Статус", callback_data="status"),
+                InlineKeyboardButton(text="💹 Фандинг", callback_data="funding")
+            ],
+            [
+                InlineKeyboardButton(text="🔝 Топ рейты", callback_data="top"),
+                InlineKeyboardButton(text="📈 Статистика", callback_data="stats")
+            ],
+            [
+                InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings"),
+                InlineKeyboardButton(text="❌ Стоп", callback_data="emergency_stop")
+            ]
+        ])
+        self._kb_refresh_home = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh")],
+            [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
+        ])
+        self._kb_home = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
+        ])
+        self._kb_confirm_stop = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Да, остановить", callback_data="confirm_stop"),
+                InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_stop")
+            ]
+        ])
     
     def _setup_handlers(self):
         # Обработчик /start
@@ -51,32 +262,19 @@ class TelegramBotServer:
         # Обработчик callback-запросов
         @self.router.callback_query()
         async def handle_callback(callback: CallbackQuery):
+            # Убираем "часики" на кнопке параллельно с перерисовкой панели
+            answer_task = asyncio.create_task(callback.answer())
             try:
-                if callback.data == "status":
-                    await self.handle_status(callback)
-                elif callback.data == "funding":
-                    await self.handle_funding(callback)
-                elif callback.data == "top":
-                    await self.handle_top(callback)
-                elif callback.data == "stats":
-                    await self.handle_stats(callback)
-                elif callback.data == "settings":
-                    await self.handle_settings(callback)
-                elif callback.data == "emergency_stop":
-                    await self.handle_emergency_stop(callback)
-                elif callback.data == "refresh":
-                    await self.handle_refresh(callback)
-                elif callback.data == "menu":
-                    await self.handle_menu(callback)
-                elif callback.data == "confirm_stop":
-                    await self.handle_confirm_stop(callback)
-                elif callback.data == "cancel_stop":
-                    await self.handle_cancel_stop(callback)
-                
-                await callback.answer()
+                handler = self._cb_handlers.get(callback.data)
+                if handler:
+                    await handler(callback)
             except Exception as e:
                 logger.error(f"Ошибка при обработке callback: {e}")
-                await callback.answer("Произошла ошибка при обработке запроса")
+            finally:
+                try:
+                    await answer_task
+                except Exception as e:
+                    logger.error(f"Ошибка при ответе на callback: {e}")
         
         # Обработчик /status
         @self.router.message(Command("status"))
@@ -98,127 +296,229 @@ class TelegramBotServer:
         async def cmd_stats(message: Message):
             await self.send_stats(message)
     
-    async def send_menu(self, message: Message, edit=False):
-        """Отправка главного меню"""
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="📊 Статус", callback_data="status"),
-                InlineKeyboardButton(text="💹 Фандинг", callback_data="funding")
-            ],
-            [
-                InlineKeyboardButton(text="🔝 Топ рейты", callback_data="top"),
-                InlineKeyboardButton(text="📈 Статистика", callback_data="stats")
-            ],
-            [
-                InlineKeyboardButton(text="⚙️ Настройки", callback_data="settings"),
-                InlineKeyboardButton(text="❌ Стоп", callback_data="emergency_stop")
-            ]
-        ])
+    async def _edit_text(self, message: Message, text, keyboard):
+        """Редактирование сообщения, пропускаемое, если текст и клавиатура не изменились"""
+        key = (message.chat.id, message.message_id)
+        render_hash = hash((text, id(keyboard)))
         
-        menu_text = (
-            "🤖 <b>Фандинг Арбитраж Бот</b>\n\n"
-            "Добро пожаловать! Я помогу вам отслеживать и торговать на фандинг рейтах Bybit.\n\n"
-            "🎯 <b>Стратегия:</b> Ищу пары с наибольшими фандинг рейтами по модулю, "
-            "открываю позицию за 10 секунд до выплаты, чтобы получить фандинг, "
-            "затем закрываю после получения выплаты.\n\n"
-            "📊 Выберите действие:"
-        )
+        # Не делаем запрос к Telegram, который вернет "message is not modified"
+        if self._last_render.get(key) == render_hash:
+            logger.info("Сообщение не изменилось, редактирование пропущено")
+            return
         
-        if edit:
-            try:
-                await message.edit_text(menu_text, reply_markup=keyboard, parse_mode="HTML")
-            except Exception as edit_error:
-                if "message is not modified" in str(edit_error):
-                    logger.info("Меню не изменилось, обновление пропущено")
-                else:
-                    raise edit_error
-        else:
-            await message.answer(menu_text, reply_markup=keyboard, parse_mode="HTML")
+        await message.edit_text(text, reply_markup=keyboard)
+        self._last_render[key] = render_hash
+    
+    async def _deliver(self, message: Message, text, keyboard, edit, tag, panel=None):
+        """Отправка нового сообщения или редактирование текущего"""
+        try:
+            if edit:
+                await self._edit_text(message, text, keyboard)
+            else:
+                message = await message.answer(text, reply_markup=keyboard)
+            
+            if panel:
+                self._panel_by_msg[(message.chat.id, message.message_id)] = panel
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+            logger.info("%s: содержимое не изменилось, обновление пропущено", tag)
+    
+    async def _deliver_error(self, message: Message, error_text, edit):
+        """Отправка сообщения об ошибке без повторного выброса исключения"""
+        try:
+            await self._deliver(message, error_text, None, edit, "Ошибка")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения об ошибке: {e}")
+    
+    def _debounce_edit(self, message: Message, sender):
+        """
+        Отложенное редактирование сообщения
+        
+        Серия нажатий за EDIT_DEBOUNCE секунд дает один запрос к Telegram,
+        выполняется последнее нажатие.
+        """
+        key = self._cancel_pending_edit(message)
+        
+        loop = asyncio.get_running_loop()
+        self._pending_edits[key] = loop.call_later(EDIT_DEBOUNCE, self._fire_edit, key, message, sender)
+    
+    def _cancel_pending_edit(self, message: Message):
+        """Отмена отложенного редактирования сообщения, возвращает его ключ"""
+        key = (message.chat.id, message.message_id)
+        
+        pending = self._pending_edits.pop(key, None)
+        if pending:
+            pending.cancel()
+        
+        return key
+    
+    def _fire_edit(self, key, message: Message, sender):
+        """Запуск отложенного редактирования"""
+        self._pending_edits.pop(key, None)
+        task = asyncio.create_task(sender(message, edit=True))
+        self._edit_tasks.add(task)
+        task.add_done_callback(self._edit_tasks.discard)
+    
+    async def send_menu(self, message: Message, edit=False):
+        """Отправка главного меню"""
+        await self._deliver(message, MENU_TEXT, self._kb_menu, edit, "Меню")
     
     async def handle_status(self, callback: CallbackQuery):
         """Обработка запроса статуса"""
-        await self.send_status(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_status)
     
     async def handle_funding(self, callback: CallbackQuery):
         """Обработка запроса фандинг рейтов"""
-        await self.send_funding(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_funding)
     
     async def handle_top(self, callback: CallbackQuery):
         """Обработка запроса топ рейтов"""
-        await self.send_top(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_top)
     
     async def handle_stats(self, callback: CallbackQuery):
         """Обработка запроса статистики"""
-        await self.send_stats(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_stats)
     
     async def handle_settings(self, callback: CallbackQuery):
         """Обработка запроса настроек"""
-        await self.send_settings(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_settings)
 
     async def handle_menu(self, callback: CallbackQuery):
         """Обработка запроса меню"""
-        await self.send_menu(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_menu)
     
     async def handle_emergency_stop(self, callback: CallbackQuery):
         """Обработка экстренной остановки"""
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Да, остановить", callback_data="confirm_stop"),
-                InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_stop")
-            ]
-        ])
+        keyboard = self._kb_confirm_stop
         
-        await callback.message.edit_text(
+        # Диалог показывается сразу, отложенная панель не должна его перезаписать
+        self._cancel_pending_edit(callback.message)
+        await self._edit_text(
+            callback.message,
             "⚠️ <b>ВНИМАНИЕ!</b>\n\n"
             "Вы действительно хотите экстренно остановить бота?\n"
             "Все открытые позиции будут закрыты!\n\n"
             "Это действие нельзя отменить.",
-            reply_markup=keyboard,
-            parse_mode="HTML"
+            keyboard
         )
     
     async def handle_confirm_stop(self, callback: CallbackQuery):
         """Подтверждение остановки бота"""
         # Здесь можно добавить логику для остановки торгового бота
-        await callback.message.edit_text(
+        self._cancel_pending_edit(callback.message)
+        await self._edit_text(
+            callback.message,
             "🛑 <b>БОТ ОСТАНОВЛЕН!</b>\n\n"
             "Все торговые операции прекращены.\n"
             "Для повторного запуска перезапустите программу.",
-            parse_mode="HTML"
+            None
         )
     
     async def handle_cancel_stop(self, callback: CallbackQuery):
         """Отмена остановки бота"""
-        await self.send_menu(callback.message, edit=True)
+        self._debounce_edit(callback.message, self.send_menu)
     
     async def handle_refresh(self, callback: CallbackQuery):
         """Обновление данных"""
         try:
-            # Определяем, какую страницу обновлять по тексту сообщения
-            if "Статус бота" in callback.message.text:
-                await self.send_status(callback.message, edit=True)
-            elif "Ближайшие фандинг выплаты" in callback.message.text:
-                await self.send_funding(callback.message, edit=True)
-            elif "Топ фандинг рейты" in callback.message.text:
-                await self.send_top(callback.message, edit=True)
-            elif "Статистика торговли" in callback.message.text:
-                await self.send_stats(callback.message, edit=True)
-            elif "Настройки бота" in callback.message.text:
-                await self.send_settings(callback.message, edit=True)
+            message = callback.message
+            panel = self._panel_by_msg.get((message.chat.id, message.message_id))
+            
+            # Сообщения, отправленные до перезапуска, определяем по заголовку
+            if panel is None:
+                panel = next(
+                    (name for title, name in PANEL_TITLES if title in (message.text or "")),
+                    None
+                )
+            
+            sender = self._panel_senders.get(panel)
+            if sender:
+                self._debounce_edit(message, sender)
         except Exception as e:
-            # Если контент не изменился, просто игнорируем ошибку
-            if "message is not modified" in str(e):
-                logger.info("Содержимое сообщения не изменилось, обновление пропущено")
-            else:
-                logger.error(f"Ошибка при обновлении: {e}")
+            logger.error(f"Ошибка при обновлении: {e}")
+    
+    @staticmethod
+    def _load_state_file(path, previous):
+        """Чтение файла состояния (блокирующее, вызывается через to_thread)"""
+        try:
+            return load_json_cached(path)
+        except FileNotFoundError:
+            return None
+        except orjson.JSONDecodeError:
+            # Файл дописывается прямо сейчас, оставляем прошлую версию
+            return previous
+    
+    def _read_state_files(self):
+        """Чтение обоих файлов состояния за один переход в поток"""
+        return (
+            self._load_state_file("bot_status.json", self._state),
+            self._load_state_file("funding_rates.json", self._funding)
+        )
+    
+    async def _refresh_state(self):
+        """Обновление разобранных файлов состояния"""
+        state, funding = await asyncio.to_thread(self._read_state_files)
+        
+        # Тексты панелей фандинга пересобираются только при новом снимке файла
+        if funding is not self._funding or self._rendered_funding is None:
+            try:
+                rendered_funding = self._render_funding(funding)
+            except Exception as e:
+                logger.error("Ошибка при подготовке фандинг рейтов: %s", e)
+                rendered_funding = "❌ Произошла ошибка при получении фандинг рейтов"
+            try:
+                rendered_top = self._render_top(funding)
+            except Exception as e:
+                logger.error("Ошибка при подготовке топ рейтов: %s", e)
+                rendered_top = "❌ Произошла ошибка при получении топ рейтов"
+            self._rendered_funding, self._rendered_top = rendered_funding, rendered_top
+        
+        self._state, self._funding = state, funding
+    
+    async def _watch_state(self):
+        """Фоновое отслеживание файлов состояния: разбор только после изменения файла"""
+        if awatch is not None:
+            try:
+                # Следим за каталогом, а не за файлами: торговый бот подменяет их через os.replace
+                await self._refresh_on_changes(awatch(
+                    ".",
+                    watch_filter=lambda change, path: os.path.basename(path) in STATE_FILES,
+                    recursive=False
+                ))
+            except Exception as e:
+                # Например, исчерпан лимит inotify: без наблюдателя данные перестанут обновляться
+                logger.error("Ошибка отслеживания файлов состояния, переходим на периодический опрос: %s", e)
+        
+        await self._refresh_on_changes(self._poll_state_files())
+    
+    async def _refresh_on_changes(self, changes):
+        """Перечитывание файлов состояния на каждое событие из changes"""
+        async for _ in changes:
+            try:
+                await self._refresh_state()
+            except Exception as e:
+                logger.error("Ошибка при чтении файлов состояния: %s", e)
+    
+    @staticmethod
+    async def _poll_state_files():
+        """Периодические проверки файлов состояния вместо событий файловой системы"""
+        while True:
+            await asyncio.sleep(STATE_POLL_INTERVAL)
+            yield
+    
+    def _current_status(self):
+        """Последний прочитанный bot_status.json"""
+        if self._state is None:
+            raise FileNotFoundError("bot_status.json")
+        return self._state
     
     async def send_status(self, message: Message, edit=False):
         """Отправка статуса бота"""
         try:
             # Читаем данные из файла состояния
             try:
-                with open("bot_status.json", "r", encoding='utf-8') as f:
-                    status_data = json.load(f)
+                status_data = self._current_status()
 
                 trading_running = status_data.get("trading_bot", {}).get("running", False)
                 update_time = status_data.get("timestamp", "неизвестно")
@@ -227,22 +527,20 @@ class TelegramBotServer:
                 statistics = status_data.get("statistics", {})
 
                 # Форматируем время обновления
-                try:
-                    update_dt = datetime.datetime.fromisoformat(update_time.replace('Z', '+00:00'))
-                    update_str = update_dt.strftime("%d.%m.%Y %H:%M:%S")
-                except:
-                    update_str = update_time
+                update_str = _format_iso(update_time)
 
-                status_text = f"📊 <b>Статус бота</b>\n"
-                status_text += f"🕐 Обновлено: {update_str}\n\n"
-                status_text += f"🤖 Торговый бот: {'✅ Активен' if trading_running else '❌ Неактивен'}\n"
-                status_text += f"💰 Баланс: <b>{balance:.2f} USDT</b>\n\n"
+                parts = [
+                    f"📊 <b>Статус бота</b>\n"
+                    f"🕐 Обновлено: {update_str}\n\n"
+                    f"🤖 Торговый бот: {'✅ Активен' if trading_running else '❌ Неактивен'}\n"
+                    f"💰 Баланс: <b>{balance:.2f} USDT</b>\n\n"
+                ]
 
                 if active_trades:
-                    status_text += f"📈 <b>Активные сделки ({len(active_trades)}):</b>\n\n"
+                    parts.append(f"📈 <b>Активные сделки ({len(active_trades)}):</b>\n\n")
                     for trade_id, trade_data in list(active_trades.items())[:5]:  # Показываем только первые 5
                         side_emoji = "🟢" if trade_data['side'] == 'Buy' else "🔴"
-                        status_text += (
+                        parts.append(
                             f"{side_emoji} <b>{trade_data['symbol']}</b>\n"
                             f"   📊 {trade_data['side']} {trade_data['size']}\n"
                             f"   💵 Вход: {trade_data['entry_price']}\n"
@@ -251,239 +549,178 @@ class TelegramBotServer:
                         )
                     
                     if len(active_trades) > 5:
-                        status_text += f"... и еще {len(active_trades) - 5} сделок\n\n"
+                        parts.append(f"... и еще {len(active_trades) - 5} сделок\n\n")
                 else:
-                    status_text += "📊 Нет активных сделок\n\n"
+                    parts.append("📊 Нет активных сделок\n\n")
 
                 # Статистика
                 if statistics:
-                    status_text += f"📈 <b>Статистика:</b>\n"
-                    status_text += f"   🎯 Всего сделок: {statistics.get('total_trades', 0)}\n"
-                    status_text += f"   ✅ Успешных: {statistics.get('successful_trades', 0)}\n"
-                    status_text += f"   📊 Успешность: {statistics.get('success_rate', 0):.1f}%\n"
-                    status_text += f"   💰 Общая прибыль: {statistics.get('total_pnl', 0):.4f} USDT\n\n"
-
-                status_text += f"⚙️ <b>Настройки:</b>\n"
-                status_text += f"   💵 Сумма сделки: {status_data.get('trade_amount_usdt', 0)} USDT\n"
-                status_text += f"   📊 Мин. фандинг: {status_data.get('min_funding_rate', 0)*100:.4f}%\n"
-                status_text += f"   ⏰ Секунд до фандинга: {status_data.get('seconds_before_funding', 0)}\n"
-                status_text += f"   🔝 Топ пар: {status_data.get('top_pairs_count', 0)}\n"
-
-            except (FileNotFoundError, json.JSONDecodeError):
+                    parts.append(
+                        f"📈 <b>Статистика:</b>\n"
+                        f"   🎯 Всего сделок: {statistics.get('total_trades', 0)}\n"
+                        f"   ✅ Успешных: {statistics.get('successful_trades', 0)}\n"
+                        f"   📊 Успешность: {statistics.get('success_rate', 0):.1f}%\n"
+                        f"   💰 Общая прибыль: {statistics.get('total_pnl', 0):.4f} USDT\n\n"
+                    )
+
+                parts.append(
+                    f"⚙️ <b>Настройки:</b>\n"
+                    f"   💵 Сумма сделки: {status_data.get('trade_amount_usdt', 0)} USDT\n"
+                    f"   📊 Мин. фандинг: {status_data.get('min_funding_rate', 0)*100:.4f}%\n"
+                    f"   ⏰ Секунд до фандинга: {status_data.get('seconds_before_funding', 0)}\n"
+                    f"   🔝 Топ пар: {status_data.get('top_pairs_count', 0)}\n"
+                )
+                status_text = "".join(parts)
+
+            except (FileNotFoundError, orjson.JSONDecodeError):
                 status_text = (
                     "📊 <b>Статус бота</b>\n\n"
                     "⚠️ Информация о статусе недоступна.\n"
                     "Торговый бот еще не запущен или не обновлял статус."
                 )
 
-            # Клавиатура
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh")],
-                [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
-            ])
-
-            if edit:
-                try:
-                    await message.edit_text(status_text, reply_markup=keyboard, parse_mode="HTML")
-                except Exception as edit_error:
-                    if "message is not modified" in str(edit_error):
-                        logger.info("Статус не изменился, обновление пропущено")
-                    else:
-                        raise edit_error
-            else:
-                await message.answer(status_text, reply_markup=keyboard, parse_mode="HTML")
+            await self._deliver(message, status_text, self._kb_refresh_home, edit, "Статус", "status")
 
         except Exception as e:
             logger.error(f"Ошибка при отправке статуса: {e}")
-            error_text = "❌ Произошла ошибка при получении статуса"
-            if edit:
-                try:
-                    await message.edit_text(error_text)
-                except Exception as edit_error:
-                    if "message is not modified" not in str(edit_error):
-                        logger.error(f"Ошибка при редактировании сообщения об ошибке: {edit_error}")
-            else:
-                await message.answer(error_text)
+            await self._deliver_error(message, "❌ Произошла ошибка при получении статуса", edit)
+    
+    @staticmethod
+    def _render_funding(funding_data):
+        """Текст панели ближайших фандинг выплат"""
+        if not (funding_data and funding_data.get("top_rates")):
+            return "📊 Информация о фандинг рейтах недоступна или еще не собрана."
+        
+        top_rates = funding_data["top_rates"]
+        update_time = funding_data.get("update_time", "неизвестно")
+        min_rate_percent = funding_data.get("min_funding_rate_percent", MIN_FUNDING_RATE * 100)
+        total_expected_profit = funding_data.get("total_expected_profit", 0)
+        
+        # Форматируем время обновления
+        update_str = _format_iso(update_time)
+        
+        parts = [
+            f"💹 <b>Ближайшие фандинг выплаты</b>\n"
+            f"🕐 Обновлено: {update_str}\n"
+            f"📊 Мин. рейт: {min_rate_percent:.5f}%\n"
+            f"💰 Ожидаемая прибыль: {total_expected_profit:.4f} USDT\n\n"
+        ]
+        
+        # Топ-10 ближайших по времени до выплаты без полной сортировки
+        available_rates = heapq.nsmallest(
+            10,
+            (rate for rate in top_rates if rate.get("seconds_until", 0) > 0),
+            key=lambda x: x.get("seconds_until", float('inf'))
+        )
+        
+        for i, rate in enumerate(available_rates, 1):
+            # Эмодзи для направления
+            direction_emoji = "🔴" if rate["rate"] > 0 else "🟢"
+            position_emoji = "📉 SHORT" if rate["rate"] > 0 else "📈 LONG"
+            
+            parts.append(
+                f"{direction_emoji} <b>{i}. {rate['symbol']}</b>\n"
+                f"   💹 Рейт: {rate['rate_percent']:+.5f}% ({rate['abs_rate_percent']:.5f}%)\n"
+                f"   {position_emoji} для получения выплаты\n"
+                f"   ⏰ До выплаты: {rate['time_until']}\n"
+                f"   💰 Ожидаемая прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
+            )
+        
+        if len(available_rates) == 0:
+            parts.append("⏰ Нет доступных выплат в ближайшее время\n")
+        elif len(top_rates) > 10:
+            parts.append(f"... и еще {len(top_rates) - 10} пар\n")
+        
+        return "".join(parts)
+    
+    @staticmethod
+    def _render_top(funding_data):
+        """Текст панели топ фандинг рейтов"""
+        if not (funding_data and funding_data.get("top_rates")):
+            return "📊 Информация о фандинг рейтах недоступна или еще не собрана."
+        
+        top_rates = funding_data["top_rates"]
+        update_time = funding_data.get("update_time", "неизвестно")
+        
+        # Форматируем время обновления
+        update_str = _format_iso(update_time)
+        
+        # Разделяем на положительные и отрицательные и берем топ-5 по модулю
+        # nlargest при равных рейтах сохраняет порядок файла, как стабильная сортировка
+        positive_rates = heapq.nlargest(
+            5, (r for r in top_rates if r.get("rate", 0) > 0), key=lambda x: x.get("abs_rate", 0)
+        )
+        negative_rates = heapq.nlargest(
+            5, (r for r in top_rates if r.get("rate", 0) < 0), key=lambda x: x.get("abs_rate", 0)
+        )
+        
+        parts = [
+            f"🔝 <b>Топ фандинг рейты</b>\n"
+            f"🕐 Обновлено: {update_str}\n\n"
+        ]
+        
+        # Топ положительные (лонгисты платят шортистам)
+        parts.append("🔴 <b>ТОП ПОЛОЖИТЕЛЬНЫЕ</b> (лонгисты платят шортистам):\n")
+        for i, rate in enumerate(positive_rates, 1):
+            parts.append(
+                f"{i}. <b>{rate['symbol']}</b>\n"
+                f"   💹 Рейт: +{rate['rate_percent']:.5f}%\n"
+                f"   📉 Открывать: SHORT\n"
+                f"   ⏰ До выплаты: {rate['time_until']}\n"
+                f"   💰 Прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
+            )
+        
+        # Топ отрицательные (шортисты платят лонгистам)
+        parts.append("🟢 <b>ТОП ОТРИЦАТЕЛЬНЫЕ</b> (шортисты платят лонгистам):\n")
+        for i, rate in enumerate(negative_rates, 1):
+            parts.append(
+                f"{i}. <b>{rate['symbol']}</b>\n"
+                f"   💹 Рейт: {rate['rate_percent']:.5f}%\n"
+                f"   📈 Открывать: LONG\n"
+                f"   ⏰ До выплаты: {rate['time_until']}\n"
+                f"   💰 Прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
+            )
+        
+        return "".join(parts)
     
     async def send_funding(self, message: Message, edit=False):
         """Отправка данных о фандинг рейтах"""
         try:
-            try:
-                with open("funding_rates.json", "r", encoding='utf-8') as f:
-                    funding_data = json.load(f)
-                
-                if funding_data and "top_rates" in funding_data and funding_data["top_rates"]:
-                    top_rates = funding_data["top_rates"]
-                    update_time = funding_data.get("update_time", "неизвестно")
-                    min_rate_percent = funding_data.get("min_funding_rate_percent", MIN_FUNDING_RATE * 100)
-                    total_expected_profit = funding_data.get("total_expected_profit", 0)
-                    
-                    # Форматируем время обновления
-                    try:
-                        update_dt = datetime.datetime.fromisoformat(update_time.replace('Z', '+00:00'))
-                        update_str = update_dt.strftime("%d.%m.%Y %H:%M:%S")
-                    except:
-                        update_str = update_time
-                    
-                    response = f"💹 <b>Ближайшие фандинг выплаты</b>\n"
-                    response += f"🕐 Обновлено: {update_str}\n"
-                    response += f"📊 Мин. рейт: {min_rate_percent:.5f}%\n"
-                    response += f"💰 Ожидаемая прибыль: {total_expected_profit:.4f} USDT\n\n"
-                    
-                    # Сортируем по времени до выплаты
-                    available_rates = [rate for rate in top_rates if rate.get("seconds_until", 0) > 0]
-                    available_rates.sort(key=lambda x: x.get("seconds_until", float('inf')))
-                    
-                    # Показываем топ-10 ближайших по времени
-                    for i, rate in enumerate(available_rates[:10], 1):
-                        # Эмодзи для направления
-                        direction_emoji = "🔴" if rate["rate"] > 0 else "🟢"
-                        position_emoji = "📉 SHORT" if rate["rate"] > 0 else "📈 LONG"
-                        
-                        response += (
-                            f"{direction_emoji} <b>{i}. {rate['symbol']}</b>\n"
-                            f"   💹 Рейт: {rate['rate_percent']:+.5f}% ({rate['abs_rate_percent']:.5f}%)\n"
-                            f"   {position_emoji} для получения выплаты\n"
-                            f"   ⏰ До выплаты: {rate['time_until']}\n"
-                            f"   💰 Ожидаемая прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
-                        )
-                    
-                    if len(available_rates) == 0:
-                        response += "⏰ Нет доступных выплат в ближайшее время\n"
-                    elif len(top_rates) > 10:
-                        response += f"... и еще {len(top_rates) - 10} пар\n"
-                    
-                else:
-                    response = "📊 Информация о фандинг рейтах недоступна или еще не собрана."
-                    
-            except (FileNotFoundError, json.JSONDecodeError):
+            if self._funding is None:
                 response = "📊 Информация о фандинг рейтах недоступна. Торговый бот еще не запущен."
-
-            # Клавиатура
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh")],
-                [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
-            ])
-
-            if edit:
-                try:
-                    await message.edit_text(response, reply_markup=keyboard, parse_mode="HTML")
-                except Exception as edit_error:
-                    if "message is not modified" in str(edit_error):
-                        logger.info("Фандинг данные не изменились, обновление пропущено")
-                    else:
-                        raise edit_error
             else:
-                await message.answer(response, reply_markup=keyboard, parse_mode="HTML")
+                response = self._rendered_funding
+
+            await self._deliver(message, response, self._kb_refresh_home, edit, "Фандинг данные", "funding")
 
         except Exception as e:
             logger.error(f"Ошибка при отправке фандинг рейтов: {e}")
-            error_text = "❌ Произошла ошибка при получении фандинг рейтов"
-            if edit:
-                try:
-                    await message.edit_text(error_text)
-                except Exception as edit_error:
-                    if "message is not modified" not in str(edit_error):
-                        logger.error(f"Ошибка при редактировании сообщения об ошибке: {edit_error}")
-            else:
-                await message.answer(error_text)
+            await self._deliver_error(message, "❌ Произошла ошибка при получении фандинг рейтов", edit)
     
     async def send_top(self, message: Message, edit=False):
         """Отправка топ фандинг рейтов"""
         try:
-            try:
-                with open("funding_rates.json", "r", encoding='utf-8') as f:
-                    funding_data = json.load(f)
-                
-                if funding_data and "top_rates" in funding_data and funding_data["top_rates"]:
-                    top_rates = funding_data["top_rates"]
-                    update_time = funding_data.get("update_time", "неизвестно")
-                    
-                    # Форматируем время обновления
-                    try:
-                        update_dt = datetime.datetime.fromisoformat(update_time.replace('Z', '+00:00'))
-                        update_str = update_dt.strftime("%d.%m.%Y %H:%M:%S")
-                    except:
-                        update_str = update_time
-                    
-                    # Разделяем на положительные и отрицательные
-                    positive_rates = [r for r in top_rates if r.get("rate", 0) > 0]
-                    negative_rates = [r for r in top_rates if r.get("rate", 0) < 0]
-                    
-                    # Сортируем по абсолютному значению
-                    positive_rates.sort(key=lambda x: x.get("abs_rate", 0), reverse=True)
-                    negative_rates.sort(key=lambda x: x.get("abs_rate", 0), reverse=True)
-                    
-                    response = f"🔝 <b>Топ фандинг рейты</b>\n"
-                    response += f"🕐 Обновлено: {update_str}\n\n"
-                    
-                    # Топ положительные (лонгисты платят шортистам)
-                    response += "🔴 <b>ТОП ПОЛОЖИТЕЛЬНЫЕ</b> (лонгисты платят шортистам):\n"
-                    for i, rate in enumerate(positive_rates[:5], 1):
-                        response += (
-                            f"{i}. <b>{rate['symbol']}</b>\n"
-                            f"   💹 Рейт: +{rate['rate_percent']:.5f}%\n"
-                            f"   📉 Открывать: SHORT\n"
-                            f"   ⏰ До выплаты: {rate['time_until']}\n"
-                            f"   💰 Прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
-                        )
-                    
-                    # Топ отрицательные (шортисты платят лонгистам)
-                    response += "🟢 <b>ТОП ОТРИЦАТЕЛЬНЫЕ</b> (шортисты платят лонгистам):\n"
-                    for i, rate in enumerate(negative_rates[:5], 1):
-                        response += (
-                            f"{i}. <b>{rate['symbol']}</b>\n"
-                            f"   💹 Рейт: {rate['rate_percent']:.5f}%\n"
-                            f"   📈 Открывать: LONG\n"
-                            f"   ⏰ До выплаты: {rate['time_until']}\n"
-                            f"   💰 Прибыль: {rate['expected_profit_usdt']:.4f} USDT\n\n"
-                        )
-                else:
-                    response = "📊 Информация о фандинг рейтах недоступна или еще не собрана."
-                    
-            except (FileNotFoundError, json.JSONDecodeError):
+            if self._funding is None:
                 response = "📊 Информация о фандинг рейтах недоступна."
-
-            # Клавиатура
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh")],
-                [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
-            ])
-
-            if edit:
-                try:
-                    await message.edit_text(response, reply_markup=keyboard, parse_mode="HTML")
-                except Exception as edit_error:
-                    if "message is not modified" in str(edit_error):
-                        logger.info("Топ рейты не изменились, обновление пропущено")
-                    else:
-                        raise edit_error
             else:
-                await message.answer(response, reply_markup=keyboard, parse_mode="HTML")
+                response = self._rendered_top
+
+            await self._deliver(message, response, self._kb_refresh_home, edit, "Топ рейты", "top")
 
         except Exception as e:
             logger.error(f"Ошибка при отправке топ рейтов: {e}")
-            error_text = "❌ Произошла ошибка при получении топ рейтов"
-            if edit:
-                try:
-                    await message.edit_text(error_text)
-                except Exception as edit_error:
-                    if "message is not modified" not in str(edit_error):
-                        logger.error(f"Ошибка при редактировании сообщения об ошибке: {edit_error}")
-            else:
-                await message.answer(error_text)
+            await self._deliver_error(message, "❌ Произошла ошибка при получении топ рейтов", edit)
     
     async def send_stats(self, message: Message, edit=False):
         """Отправка статистики"""
         try:
             try:
-                with open("bot_status.json", "r", encoding='utf-8') as f:
-                    status_data = json.load(f)
+                status_data = self._current_status()
 
                 statistics = status_data.get("statistics", {})
                 balance = status_data.get("balance", 0)
                 
-                response = f"📈 <b>Статистика торговли</b>\n\n"
+                parts = [f"📈 <b>Статистика торговли</b>\n\n"]
                 
                 if statistics:
                     total_trades = statistics.get("total_trades", 0)
@@ -491,149 +728,192 @@ class TelegramBotServer:
                     success_rate = statistics.get("success_rate", 0)
                     total_pnl = statistics.get("total_pnl", 0)
                     
-                    response += f"🎯 <b>Всего сделок:</b> {total_trades}\n"
-                    response += f"✅ <b>Успешных:</b> {successful_trades}\n"
-                    response += f"❌ <b>Убыточных:</b> {total_trades - successful_trades}\n"
-                    response += f"📊 <b>Успешность:</b> {success_rate:.1f}%\n\n"
+                    parts.append(
+                        f"🎯 <b>Всего сделок:</b> {total_trades}\n"
+                        f"✅ <b>Успешных:</b> {successful_trades}\n"
+                        f"❌ <b>Убыточных:</b> {total_trades - successful_trades}\n"
+                        f"📊 <b>Успешность:</b> {success_rate:.1f}%\n\n"
+                    )
                     
-                    response += f"💰 <b>Текущий баланс:</b> {balance:.2f} USDT\n"
-                    response += f"💸 <b>Общая прибыль:</b> {total_pnl:+.4f} USDT\n"
+                    parts.append(
+                        f"💰 <b>Текущий баланс:</b> {balance:.2f} USDT\n"
+                        f"💸 <b>Общая прибыль:</b> {total_pnl:+.4f} USDT\n"
+                    )
                     
                     if total_trades > 0:
                         avg_profit = total_pnl / total_trades
-                        response += f"📊 <b>Средняя прибыль:</b> {avg_profit:+.4f} USDT\n"
+                        parts.append(f"📊 <b>Средняя прибыль:</b> {avg_profit:+.4f} USDT\n")
                     
                     # Цветовой индикатор прибыльности
                     if total_pnl > 0:
-                        response += "\n🟢 <b>Торговля прибыльная!</b>"
+                        parts.append("\n🟢 <b>Торговля прибыльная!</b>")
                     elif total_pnl < 0:
-                        response += "\n🔴 <b>Торговля убыточная</b>"
+                        parts.append("\n🔴 <b>Торговля убыточная</b>")
                     else:
-                        response += "\n🟡 <b>Торговля в нуле</b>"
+                        parts.append("\n🟡 <b>Торговля в нуле</b>")
                 else:
-                    response += "📊 Статистика пока недоступна.\nНачните торговлю для получения данных."
+                    parts.append("📊 Статистика пока недоступна.\nНачните торговлю для получения данных.")
+                
+                response = "".join(parts)
 
-            except (FileNotFoundError, json.JSONDecodeError):
+            except (FileNotFoundError, orjson.JSONDecodeError):
                 response = "📊 Статистика недоступна. Торговый бот еще не запущен."
 
-            # Клавиатура
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh")],
-                [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
-            ])
-
-            if edit:
-                try:
-                    await message.edit_text(response, reply_markup=keyboard, parse_mode="HTML")
-                except Exception as edit_error:
-                    if "message is not modified" in str(edit_error):
-                        logger.info("Статистика не изменилась, обновление пропущено")
-                    else:
-                        raise edit_error
-            else:
-                await message.answer(response, reply_markup=keyboard, parse_mode="HTML")
+            await self._deliver(message, response, self._kb_refresh_home, edit, "Статистика", "stats")
 
         except Exception as e:
             logger.error(f"Ошибка при отправке статистики: {e}")
-            error_text = "❌ Произошла ошибка при получении статистики"
-            if edit:
-                try:
-                    await message.edit_text(error_text)
-                except Exception as edit_error:
-                    if "message is not modified" not in str(edit_error):
-                        logger.error(f"Ошибка при редактировании сообщения об ошибке: {edit_error}")
-            else:
-                await message.answer(error_text)
+            await self._deliver_error(message, "❌ Произошла ошибка при получении статистики", edit)
     
     async def send_settings(self, message: Message, edit=False):
         """Отправка настроек"""
         try:
             try:
-                with open("bot_status.json", "r", encoding='utf-8') as f:
-                    status_data = json.load(f)
-
-                response = f"⚙️ <b>Настройки бота</b>\n\n"
-                response += f"💵 <b>Сумма сделки:</b> {status_data.get('trade_amount_usdt', 0)} USDT\n"
-                response += f"📊 <b>Мин. фандинг рейт:</b> {status_data.get('min_funding_rate', 0)*100:.4f}%\n"
-                response += f"⏰ <b>Секунд до фандинга:</b> {status_data.get('seconds_before_funding', 0)}\n"
-                response += f"🔝 <b>Топ пар для торговли:</b> {status_data.get('top_pairs_count', 0)}\n\n"
-                response += f"📈 <b>Стратегия:</b>\n"
-                response += f"• Ищем {status_data.get('top_pairs_count', 20)} пар с наибольшим фандинг рейтом по модулю\n"
-                response += f"• Открываем позицию за {status_data.get('seconds_before_funding', 10)} сек до выплаты\n"
-                response += f"• Если рейт положительный → SHORT (получаем от лонгистов)\n"
-                response += f"• Если рейт отрицательный → LONG (получаем от шортистов)\n"
-                response += f"• Закрываем через 30 сек после получения фандинга\n\n"
-                response += f"⚠️ <i>Настройки можно изменить только в .env файле</i>"
-
-            except (FileNotFoundError, json.JSONDecodeError):
+                status_data = self._current_status()
+
+                response = SETTINGS_TEMPLATE.format_map({
+                    "trade_amount_usdt": status_data.get("trade_amount_usdt", 0),
+                    "min_funding_rate_percent": status_data.get("min_funding_rate", 0) * 100,
+                    "seconds_before_funding": status_data.get("seconds_before_funding", 0),
+                    "top_pairs_count": status_data.get("top_pairs_count", 0),
+                    "strategy_pairs_count": status_data.get("top_pairs_count", 20),
+                    "strategy_seconds": status_data.get("seconds_before_funding", 10)
+                })
+
+            except (FileNotFoundError, orjson.JSONDecodeError):
                 response = "⚙️ Настройки недоступны. Торговый бот еще не запущен."
 
-            # Клавиатура
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🏠 Главная", callback_data="menu")]
-            ])
-
-            if edit:
-                try:
-                    await message.edit_text(response, reply_markup=keyboard, parse_mode="HTML")
-                except Exception as edit_error:
-                    if "message is not modified" in str(edit_error):
-                        logger.info("Настройки не изменились, обновление пропущено")
-                    else:
-                        raise edit_error
-            else:
-                await message.answer(response, reply_markup=keyboard, parse_mode="HTML")
+            await self._deliver(message, response, self._kb_home, edit, "Настройки", "settings")
 
         except Exception as e:
             logger.error(f"Ошибка при отправке настроек: {e}")
-            error_text = "❌ Произошла ошибка при получении настроек"
-            if edit:
-                try:
-                    await message.edit_text(error_text)
-                except Exception as edit_error:
-                    if "message is not modified" not in str(edit_error):
-                        logger.error(f"Ошибка при редактировании сообщения об ошибке: {edit_error}")
-            else:
-                await message.answer(error_text)
+            await self._deliver_error(message, "❌ Произошла ошибка при получении настроек", edit)
     
     async def start(self):
         """Запуск бота"""
-        logger.info("Запуск Telegram бота...")
-        await self.dp.start_polling(self.bot, skip_updates=True)
+        # Файлы состояния читаются в фоне, обработчики берут уже разобранные данные
+        await self._refresh_state()
+        self._watch_task = asyncio.create_task(self._watch_state())
+        
+        try:
+            if TELEGRAM_WEBHOOK_URL:
+                await self.start_webhook()
+                return
+            
+            logger.info("Запуск Telegram бота (long polling)...")
+            # Сбрасываем накопившиеся апдейты одним запросом и держим длинный getUpdates
+            await self.bot.delete_webhook(drop_pending_updates=True)
+            # Сигналы обрабатывает main(), aiogram не должен ставить свои обработчики
+            await self.dp.start_polling(self.bot, polling_timeout=POLLING_TIMEOUT, handle_signals=False)
+        finally:
+            self._watch_task.cancel()
+    
+    async def start_webhook(self):
+        """Запуск бота в режиме webhook: Telegram сам присылает апдейты, без опроса"""
+        app = web.Application()
+        SimpleRequestHandler(
+            dispatcher=self.dp,
+            bot=self.bot,
+            secret_token=TELEGRAM_WEBHOOK_SECRET
+        ).register(app, path=TELEGRAM_WEBHOOK_PATH)
+        setup_application(app, self.dp, bot=self.bot)
+        
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        await site.start()
+        
+        try:
+            await self.bot.set_webhook(
+                f"{TELEGRAM_WEBHOOK_URL}{TELEGRAM_WEBHOOK_PATH}",
+                secret_token=TELEGRAM_WEBHOOK_SECRET,
+                drop_pending_updates=True
+            )
+            logger.info(f"Запуск Telegram бота (webhook на порту {WEBHOOK_PORT})...")
+            
+            # Ждем до отмены задачи, обработка апдейтов идет в aiohttp
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    
+    async def send_startup_message(self):
+        """Отправка сообщения о запуске, если указан ID пользователя"""
+        if not self.user_id:
+            return
+        
+        try:
+            await self.bot.send_message(chat_id=self.user_id, text=STARTUP_TEXT)
+            logger.info("Отправлено стартовое сообщение пользователю %s", self.user_id)
+        except TelegramAPIError as e:
+            logger.error("Ошибка при отправке стартового сообщения: %s", e)
+    
+    def _status_for_update(self):
+        """
+        Текущее содержимое bot_status.json для обновления
+        
+        Файл перечитывается, только если после нашей последней записи
+        его изменил торговый бот.
+        """
+        try:
+            version = file_version(os.stat("bot_status.json"))
+        except FileNotFoundError:
+            return {}
+        
+        if self._status_cache and self._status_cache[0] == version:
+            return self._status_cache[1]
+        
+        # Эту версию файла уже разобрал наблюдатель за состоянием. Копия нужна,
+        # потому что его словарь читают обработчики, а мы меняем верхние ключи
+        parsed = _json_cache.get("bot_status.json")
+        if parsed and parsed[0] == version:
+            return dict(parsed[1])
+        
+        # Файл могли удалить между stat и open
+        try:
+            with open("bot_status.json", "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return {}
+    
+    def _write_status_sync(self, status):
+        """
+        Слияние статуса Telegram бота с bot_status.json и атомарная запись
+        (блокирующее, вызывается через to_thread)
+        """
+        existing_status = self._status_for_update()
+        existing_status["telegram_bot"] = status["telegram_bot"]
+        existing_status["timestamp"] = status["timestamp"]
+        
+        # Атомарная запись: читатели не увидят наполовину записанный файл.
+        # Имя временного файла свое, чтобы не столкнуться с торговым ботом
+        tmp_path = f"bot_status.json.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(existing_status, option=orjson.OPT_NON_STR_KEYS))
+            f.flush()
+            # Версию берем у временного файла: rename сохраняет inode и mtime, а stat
+            # после replace мог бы увидеть уже файл, подмененный торговым ботом
+            version = file_version(os.fstat(f.fileno()))
+        os.replace(tmp_path, "bot_status.json")
+        
+        self._status_cache = (version, existing_status)
     
     async def save_status(self, running=True):
         """Сохранение статуса Telegram бота в файл"""
+        now_iso = datetime.datetime.now().isoformat()
+        status = {
+            "telegram_bot": {
+                "running": running,
+                "start_time": now_iso if running else None
+            },
+            "timestamp": now_iso
+        }
+        
+        # Вся работа с файлом выполняется одним переходом в поток
         try:
-            status = {
-                "telegram_bot": {
-                    "running": running,
-                    "start_time": datetime.datetime.now().isoformat() if running else None
-                },
-                "timestamp": datetime.datetime.now().isoformat()
-            }
-            
-            # Пытаемся обновить существующий файл статуса, если он есть
-            try:
-                if os.path.exists("bot_status.json"):
-                    with open("bot_status.json", "r", encoding='utf-8') as f:
-                        existing_status = json.load(f)
-                    
-                    existing_status["telegram_bot"] = status["telegram_bot"]
-                    existing_status["timestamp"] = status["timestamp"]
-                    
-                    with open("bot_status.json", "w", encoding='utf-8') as f:
-                        json.dump(existing_status, f, indent=4, ensure_ascii=False)
-                else:
-                    with open("bot_status.json", "w", encoding='utf-8') as f:
-                        json.dump(status, f, indent=4, ensure_ascii=False)
-                        
-                logger.info(f"Сохранен статус Telegram бота (running={running})")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при сохранении статуса: {e}")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при подготовке статуса: {e}")
+            await asyncio.to_thread(self._write_status_sync, status)
+            logger.info("Сохранен статус Telegram бота (running=%s)", running)
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.error("Ошибка при сохранении статуса: %s", e)
 
 async def main():
     """Главная функция запуска Telegram бота"""
@@ -646,47 +926,58 @@ async def main():
         # Создаем и запускаем бот
         bot_server = TelegramBotServer(TELEGRAM_BOT_TOKEN, TELEGRAM_USER_ID)
         
-        # Сохраняем статус запуска
-        await bot_server.save_status(running=True)
+        # Сохраняем статус запуска и отправляем стартовое сообщение одновременно.
+        # Обе корутины сами логируют свои ошибки
+        await asyncio.gather(
+            bot_server.save_status(running=True),
+            bot_server.send_startup_message()
+        )
         
-        # Отправляем сообщение о запуске, если указан ID пользователя
-        if TELEGRAM_USER_ID:
+        # Сигналы остановки обрабатываются внутри event loop
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
             try:
-                await bot_server.bot.send_message(
-                    chat_id=TELEGRAM_USER_ID,
-                    text="🤖 <b>Telegram бот запущен!</b>\n\n"
-                         "✅ Бот готов к работе\n"
-                         "📊 Используйте /start для начала работы\n"
-                         "💹 Мониторинг фандинг рейтов активен",
-                    parse_mode="HTML"
-                )
-                logger.info(f"Отправлено стартовое сообщение пользователю {TELEGRAM_USER_ID}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке стартового сообщения: {e}")
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # На Windows event loop не умеет обрабатывать сигналы, ставим обычный обработчик
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+        
+        # Запускаем бота и ждем его завершения или сигнала остановки
+        bot_task = asyncio.create_task(bot_server.start())
+        stop_task = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
         
-        # Запускаем бота
-        await bot_server.start()
+        if stop_event.is_set():
+            logger.info("Получен сигнал остановки, завершаем работу...")
         
-    except Exception as e:
-        logger.error(f"Критическая ошибка в Telegram боте: {e}")
+        stop_task.cancel()
+        bot_task.cancel()
+        result, = await asyncio.gather(bot_task, return_exceptions=True)
+        
+        # Отмечаем остановку в файле статуса
+        await bot_server.save_status(running=False)
+        
+        # Сбои Telegram API и ОС логируем, ошибки в коде пробрасываем дальше
+        if isinstance(result, (TelegramAPIError, OSError)):
+            logger.error("Критическая ошибка в Telegram боте: %s", result)
+        elif isinstance(result, Exception):
+            raise result
+        
+    except (TelegramAPIError, OSError) as e:
+        logger.error("Критическая ошибка в Telegram боте: %s", e)
+    finally:
+        # Закрываем пул соединений к Telegram API
+        await close_shared_session()
 
 if __name__ == "__main__":
-    # Обработка Ctrl+C и других сигналов
-    import signal
-    import sys
-    
-    def signal_handler(sig, frame):
-        logger.info(f"Получен сигнал {sig}, завершаем работу...")
-        asyncio.create_task(shutdown())
-    
-    async def shutdown():
-        # Здесь можно добавить код для корректного завершения бота
-        sys.exit(0)
-    
-    # Регистрируем обработчики сигналов
-    if sys.platform != 'win32':  # Не работает на Windows
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+    # Более быстрый event loop, если uvloop установлен
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     
     # Запускаем основную функцию
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        # Дописываем оставшиеся в очереди записи лога
+        _log_listener.stop()
\ No newline at end of file
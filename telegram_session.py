@@ -0,0 +1,54 @@
+from typing import Optional
+
+import orjson
+from aiogram.client.session.aiohttp import AiohttpSession
+
+# Параметры пула соединений к api.telegram.org
+CONNECTION_LIMIT = 32
+CONNECTION_LIMIT_PER_HOST = 16
+DNS_CACHE_TTL = 600  # Секунд хранения DNS записи
+KEEPALIVE_TIMEOUT = 75  # Секунд удержания простаивающего соединения
+
+_shared_session: Optional[AiohttpSession] = None
+
+
+def _orjson_dumps(obj) -> str:
+    """Сериализация через orjson, aiogram ожидает строку"""
+    return orjson.dumps(obj).decode()
+
+
+def get_shared_session() -> AiohttpSession:
+    """
+    Получение общей HTTP сессии для всех экземпляров Bot в процессе
+
+    Один пул keep-alive соединений и один DNS кэш на процесс, поэтому
+    пачка уведомлений не платит за новый TLS handshake на каждый запрос.
+
+    Returns:
+        AiohttpSession: Сессия для передачи в Bot(session=...)
+    """
+    global _shared_session
+
+    if _shared_session is None:
+        _shared_session = AiohttpSession(
+            limit=CONNECTION_LIMIT,
+            json_loads=orjson.loads,
+            json_dumps=_orjson_dumps,
+        )
+        # Настройки коннектора применяются при создании aiohttp.ClientSession
+        _shared_session._connector_init.update(
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+
+    return _shared_session
+
+
+async def close_shared_session() -> None:
+    """Закрытие общей HTTP сессии при завершении процесса"""
+    global _shared_session
+
+    if _shared_session is not None:
+        await _shared_session.close()
+        _shared_session = None